@@ -0,0 +1,270 @@
+from flask import request, jsonify
+from functools import wraps
+from werkzeug.exceptions import HTTPException
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from instrumentation import observe_phase
+
+logger = logging.getLogger('playpad')
+
+# Per-endpoint defaults. Every field can be overridden from the environment as
+# ADMISSION_<NAME>_<FIELD>, e.g. ADMISSION_CHATBOT_CONCURRENCY=2.
+# rate is in requests per second per client and burst is the bucket size. At
+# most `concurrency` requests run the endpoint and `queue` more may wait up to
+# `timeout` seconds for a slot; anything beyond that gets a 503 straight away.
+ENDPOINT_LIMITS = {
+    'chatbot': {'rate': 0.5, 'burst': 10, 'concurrency': 2, 'queue': 0, 'timeout': 0.0},
+    'voicechat': {'rate': 0.2, 'burst': 5, 'concurrency': 1, 'queue': 0, 'timeout': 0.0},
+    'generate_tasks': {'rate': 0.2, 'burst': 5, 'concurrency': 1, 'queue': 0, 'timeout': 0.0},
+}
+
+# Request threads per worker process (set to the WSGI server's thread count).
+# At most half of them may run or wait on limited endpoints at once, so cheap
+# routes always have threads left. Read in init_app().
+WORKER_THREADS = 8
+
+# How often stale token buckets are dropped, in seconds
+PRUNE_INTERVAL = 60.0
+
+
+class MemoryBackend:
+    """Token buckets kept in process memory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._last_prune = time.monotonic()
+
+    def take(self, key, rate, burst):
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                self._prune(now)
+        return wait
+
+    def refund(self, key, rate, burst):
+        """Give back a token taken by a request that was not served"""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated, _ = self._buckets[key]
+                tokens = min(burst, tokens + 1)
+                self._buckets[key] = (tokens, updated, updated + (burst - tokens) / rate)
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as a missing one
+        self._buckets = {key: value for key, value in self._buckets.items() if value[2] > now}
+        self._last_prune = now
+
+
+class SQLiteBackend:
+    """Token buckets shared between worker processes through a SQLite file.
+
+    Any database error (including a lock held for longer than LOCK_TIMEOUT)
+    lets the request through rather than stalling or failing it.
+    """
+
+    LOCK_TIMEOUT = 0.25
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS token_buckets '
+                     '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS token_buckets_full_at ON token_buckets (full_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.LOCK_TIMEOUT, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        try:
+            return self._take(key, rate, burst)
+        except sqlite3.Error as e:
+            logger.warning('Rate limit store unavailable, allowing request: %s', e)
+            return 0
+
+    def refund(self, key, rate, burst):
+        """Give back a token taken by a request that was not served"""
+        try:
+            self._connect().execute(
+                'UPDATE token_buckets SET tokens = MIN(:burst, tokens + 1), '
+                'full_at = updated + (:burst - MIN(:burst, tokens + 1)) / :rate WHERE key = :key',
+                {'key': key, 'rate': rate, 'burst': burst})
+        except sqlite3.Error as e:
+            logger.warning('Rate limit store unavailable, token not refunded: %s', e)
+
+    def _take(self, key, rate, burst):
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM token_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO token_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                         (key, tokens, now, now + (burst - tokens) / rate))
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                conn.execute('DELETE FROM token_buckets WHERE full_at <= ?', (now,))
+                self._last_prune = now
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return wait
+
+
+class ConcurrencyLimiter:
+    """Bounds the requests running an endpoint, with a bounded wait queue"""
+
+    def __init__(self, limit, queue, timeout):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot; return False if the queue is full or the wait timed out"""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                observe_phase('admission_wait', 0.0)
+                return True
+            if self.waiting >= self.queue or self.timeout <= 0:
+                return False
+            self.waiting += 1
+            start = time.monotonic()
+            try:
+                while self.active >= self.limit:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                observe_phase('admission_wait', time.monotonic() - start)
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+# All replaced in init_app()
+_backend = MemoryBackend()
+_limiters = {}
+_shared_slots = threading.BoundedSemaphore(WORKER_THREADS // 2)
+
+
+def client_key():
+    """Identify the calling client"""
+    return request.remote_addr or 'unknown'
+
+
+def _reject(message, status, retry_after):
+    return jsonify({'error': message}), status, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+
+def _endpoint_limits(name):
+    limits = dict(ENDPOINT_LIMITS[name])
+    for field, default in limits.items():
+        value = os.environ.get(f'ADMISSION_{name.upper()}_{field.upper()}')
+        if value is not None:
+            limits[field] = type(default)(value)
+    return limits
+
+
+def limit(name, max_body=None):
+    """Rate limit an endpoint per client and bound how many requests run it at once.
+
+    Limits come from ENDPOINT_LIMITS[name]. If max_body is given, requests
+    declaring a larger Content-Length are refused with a 413 before any
+    admission check; bodies without one are only held to MAX_CONTENT_LENGTH.
+    Requests turned away with a 503 get their rate limit token back.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if max_body is not None and request.content_length and request.content_length > max_body:
+                return jsonify({'error': 'Request body too large'}), 413
+
+            limits = _limiters[name]
+            key = f'{name}:{client_key()}'
+            wait = _backend.take(key, limits['rate'], limits['burst'])
+            if wait:
+                return _reject('Too many requests', 429, wait)
+            if not limits['limiter'].acquire():
+                _backend.refund(key, limits['rate'], limits['burst'])
+                return _reject('Server busy, try again later', 503, max(1.0, limits['timeout']))
+            try:
+                if not _shared_slots.acquire(blocking=False):
+                    _backend.refund(key, limits['rate'], limits['burst'])
+                    return _reject('Server busy, try again later', 503, 1)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    _shared_slots.release()
+            finally:
+                limits['limiter'].release()
+        return wrapper
+    return decorator
+
+
+def _json_error(e):
+    # Keep API error bodies JSON, including 413s from MAX_CONTENT_LENGTH
+    if request.path.startswith('/api/'):
+        return jsonify({'error': e.description}), e.code
+    return e
+
+
+def init_app(app):
+    """Configure endpoint limits, the rate limit backend and the request size cap"""
+    global _backend, _shared_slots, WORKER_THREADS
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', WORKER_THREADS))
+    _shared_slots = threading.BoundedSemaphore(max(1, WORKER_THREADS // 2))
+    for name in ENDPOINT_LIMITS:
+        limits = _endpoint_limits(name)
+        limits['limiter'] = ConcurrencyLimiter(limits['concurrency'], limits['queue'], limits['timeout'])
+        _limiters[name] = limits
+    reserved = sum(limits['concurrency'] + limits['queue'] for limits in _limiters.values())
+    if reserved > max(1, WORKER_THREADS // 2):
+        logger.warning('Limited endpoints may hold %d of %d worker threads; '
+                       'lower ADMISSION_*_CONCURRENCY/QUEUE or raise WORKER_THREADS',
+                       reserved, WORKER_THREADS)
+
+    db_path = os.environ.get('RATE_LIMIT_DB')
+    if db_path:
+        _backend = SQLiteBackend(db_path)
+
+    if app.config.get('MAX_CONTENT_LENGTH') is None:
+        app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+    app.register_error_handler(HTTPException, _json_error)
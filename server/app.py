@@ -1,14 +1,25 @@
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+import logging
 import os
 from dotenv import load_dotenv
+import admission
+import instrumentation
 
 # Load environment variables from .env file
 load_dotenv()
+log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=log_level if isinstance(logging.getLevelName(log_level), int) else logging.INFO)
 
 app = Flask(__name__, static_folder='static')
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+# Request latency, phase timers and the /metrics endpoint
+instrumentation.init_app(app)
+
+# Rate limiting backend and request size cap
+admission.init_app(app)
+
 # Create static/audio directory if it doesn't exist
 os.makedirs(os.path.join(app.static_folder, 'audio'), exist_ok=True)
 
@@ -0,0 +1,214 @@
+from flask import abort, current_app, g, request, Response
+from flask.json.provider import DefaultJSONProvider
+from contextlib import contextmanager
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import secrets
+import threading
+import time
+
+logger = logging.getLogger('playpad')
+
+# Latency buckets in seconds (Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Opt-in profiler for slow requests: a fraction of requests run under cProfile
+# and the top functions are logged when the request exceeds the threshold.
+# Both are read from the environment in init_app().
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_SLOW_MS = 1000.0
+
+# /metrics requires `Authorization: Bearer <METRICS_TOKEN>`. Without a token it
+# is only served in debug mode, to loopback clients (a reverse proxy on the same
+# host looks like loopback, so production needs the token). Read in init_app().
+METRICS_TOKEN = None
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+_lock = threading.Lock()
+_request_latency = {}   # (method, route, status) -> histogram
+_phase_latency = {}     # phase -> histogram
+_in_flight = {}         # (method, route) -> count
+_cache_lookups = {}     # (cache, result) -> count
+
+
+def _new_histogram():
+    return {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+
+
+def _observe(table, key, seconds):
+    with _lock:
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = _new_histogram()
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                hist['buckets'][i] += 1
+        hist['sum'] += seconds
+        hist['count'] += 1
+
+
+def observe_phase(phase, seconds):
+    """Record the duration of a named phase"""
+    _observe(_phase_latency, phase, seconds)
+
+
+@contextmanager
+def timed(phase):
+    """Time the enclosed block as a named phase"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    key = (cache, 'hit' if hit else 'miss')
+    with _lock:
+        _cache_lookups[key] = _cache_lookups.get(key, 0) + 1
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that times response encoding"""
+
+    def response(self, *args, **kwargs):
+        with timed('json_encode'):
+            return super().response(*args, **kwargs)
+
+
+def _route_key():
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    return request.method, rule
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = _route_key()
+    with _lock:
+        _in_flight[g.metrics_route] = _in_flight.get(g.metrics_route, 0) + 1
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request on a concurrent thread already holds the profiler
+            return
+        g.metrics_profiler = profiler
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    method, rule = g.pop('metrics_route')
+    status = g.pop('metrics_status', 500)
+    with _lock:
+        _in_flight[(method, rule)] -= 1
+    _observe(_request_latency, (method, rule, str(status)), elapsed)
+
+    if exc is not None:
+        # Flask has already logged the traceback
+        logger.error('%s %s failed after %.1fms: %r', method, rule, elapsed * 1000, exc)
+    elif status >= 500 and status != 503:
+        # 503s (and 429s) are deliberate load shedding; they show up in the
+        # request histogram by status instead of one warning each
+        logger.warning('%s %s returned %s in %.1fms', method, rule, status, elapsed * 1000)
+    else:
+        logger.debug('%s %s returned %s in %.1fms', method, rule, status, elapsed * 1000)
+
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+            logger.warning('Slow request %s %s (%.1fms):\n%s', method, rule, elapsed * 1000, out.getvalue())
+
+
+def _metrics_allowed():
+    if METRICS_TOKEN:
+        return secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    return current_app.debug and request.remote_addr in LOOPBACK_ADDRS
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _render_histogram(lines, name, help_text, table, label_names):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, hist in sorted(table.items()):
+        if not isinstance(key, tuple):
+            key = (key,)
+        labels = dict(zip(label_names, key))
+        for bound, count in zip(LATENCY_BUCKETS, hist['buckets']):
+            lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {count}')
+        lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {hist["count"]}')
+        lines.append(f'{name}_sum{_labels(**labels)} {hist["sum"]}')
+        lines.append(f'{name}_count{_labels(**labels)} {hist["count"]}')
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        _render_histogram(lines, 'playpad_request_duration_seconds',
+                          'Request latency by route.', _request_latency,
+                          ('method', 'route', 'status'))
+        _render_histogram(lines, 'playpad_phase_duration_seconds',
+                          'Latency of internal phases (storage, upstream calls, rendering).',
+                          _phase_latency, ('phase',))
+
+        lines.append('# HELP playpad_requests_in_flight Requests currently being served.')
+        lines.append('# TYPE playpad_requests_in_flight gauge')
+        for (method, rule), count in sorted(_in_flight.items()):
+            lines.append(f'playpad_requests_in_flight{_labels(method=method, route=rule)} {count}')
+
+        lines.append('# HELP playpad_cache_lookups_total Cache lookups by result.')
+        lines.append('# TYPE playpad_cache_lookups_total counter')
+        caches = sorted({cache for cache, _ in _cache_lookups})
+        for (cache, result), count in sorted(_cache_lookups.items()):
+            lines.append(f'playpad_cache_lookups_total{_labels(cache=cache, result=result)} {count}')
+
+        lines.append('# HELP playpad_cache_hit_ratio Fraction of cache lookups that were hits.')
+        lines.append('# TYPE playpad_cache_hit_ratio gauge')
+        for cache in caches:
+            hits = _cache_lookups.get((cache, 'hit'), 0)
+            total = hits + _cache_lookups.get((cache, 'miss'), 0)
+            lines.append(f'playpad_cache_hit_ratio{_labels(cache=cache)} {hits / total}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """Register request hooks, the timed JSON provider and the /metrics endpoint"""
+    global PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, METRICS_TOKEN
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', PROFILE_SAMPLE_RATE))
+    PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', PROFILE_SLOW_MS))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+    app.json = TimedJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not _metrics_allowed():
+            abort(404)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
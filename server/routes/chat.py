@@ -5,6 +5,8 @@ import requests
 import webbrowser
 from urllib.parse import quote
 import re
+from instrumentation import timed
+from admission import limit
 
 chat_bp = Blueprint('chat', __name__)
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
@@ -32,7 +34,8 @@ def handle_command(text):
     elif text.startswith('search wikipedia for '):
         query = text.replace('search wikipedia for ', '').strip()
         try:
-            summary = wikipedia.summary(query, sentences=2)
+            with timed('wikipedia'):
+                summary = wikipedia.summary(query, sentences=2)
             return f"Wikipedia summary for '{query}': {summary}"
         except Exception as e:
             return f"Wikipedia search error: {str(e)}"
@@ -40,7 +43,8 @@ def handle_command(text):
         song_name = text.replace('open song ', '').strip()
         search_url = f"https://www.youtube.com/results?search_query={quote(song_name)}"
         try:
-            r = requests.get(search_url)
+            with timed('youtube_search'):
+                r = requests.get(search_url)
             if r.status_code == 200 and 'watch?v=' in r.text:
                 match = re.search(r"watch\?v=([\w-]{11})", r.text)
                 if match:
@@ -54,6 +58,7 @@ def handle_command(text):
     return None
 
 @chat_bp.route('/api/chatbot', methods=['POST'])
+@limit('chatbot')
 def chatbot():
     data = request.json
     user_text = data.get('text', '')
@@ -76,7 +81,8 @@ def chatbot():
                 }
             ]
         }
-        r = requests.post(GEMINI_API_URL, headers=headers, json=payload)
+        with timed('gemini'):
+            r = requests.post(GEMINI_API_URL, headers=headers, json=payload)
         r.raise_for_status()
         data = r.json()
         ai_response = data.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', 'No response from Gemini.')
@@ -1,4 +1,8 @@
 from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import HTTPException
+import logging
+
+logger = logging.getLogger('playpad')
 
 chess_bp = Blueprint('chess', __name__)
 
@@ -14,7 +18,10 @@ def make_move():
             'evaluation': '+0.3',
             'suggestion': 'Consider controlling the center'
         })
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @chess_bp.route('/api/chess/analyze', methods=['POST'])
@@ -33,7 +40,10 @@ def analyze_position():
                 'Castle for king safety'
             ]
         })
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @chess_bp.route('/api/chess/hint', methods=['POST'])
@@ -46,5 +56,8 @@ def get_hint():
             'move': 'e4',
             'explanation': 'Controls the center and opens lines for both bishop and queen'
         })
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
@@ -1,4 +1,5 @@
 from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import HTTPException
 from ics import Calendar, Event
 from fpdf import FPDF
 import csv
@@ -7,6 +8,11 @@ import os
 from io import StringIO
 from datetime import datetime, timedelta
 import uuid
+import logging
+from instrumentation import timed
+from admission import limit
+
+logger = logging.getLogger('playpad')
 
 scheduler_bp = Blueprint('scheduler', __name__)
 
@@ -17,7 +23,7 @@ def load_tasks():
     """Load tasks from JSON file"""
     if os.path.exists(TASKS_FILE):
         try:
-            with open(TASKS_FILE, 'r') as f:
+            with timed('store_load'), open(TASKS_FILE, 'r') as f:
                 return json.load(f)
         except (json.JSONDecodeError, IOError):
             return []
@@ -26,7 +32,7 @@ def load_tasks():
 def save_tasks(tasks_list):
     """Save tasks to JSON file"""
     try:
-        with open(TASKS_FILE, 'w') as f:
+        with timed('store_save'), open(TASKS_FILE, 'w') as f:
             json.dump(tasks_list, f, indent=2)
         return True
     except IOError:
@@ -66,7 +72,10 @@ def export_tasks_csv():
             'Content-Type': 'text/csv',
             'Content-Disposition': 'attachment; filename=tasks.csv'
         }
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @scheduler_bp.route('/api/tasks/export/ics', methods=['GET'])
@@ -103,14 +112,17 @@ def export_tasks_ics():
                     
                     cal.events.add(e)
                 except ValueError as ve:
-                    print(f"Error parsing task {task.get('id', 'unknown')}: {ve}")
+                    logger.warning("Error parsing task %s: %s", task.get('id', 'unknown'), ve)
                     continue
         
         return str(cal), 200, {
             'Content-Type': 'text/calendar',
             'Content-Disposition': 'attachment; filename=tasks.ics'
         }
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @scheduler_bp.route('/api/tasks/export/pdf', methods=['GET'])
@@ -118,39 +130,44 @@ def export_tasks_pdf():
     """Export tasks as PDF"""
     try:
         tasks = load_tasks()
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=16, style='B')
-        pdf.cell(200, 10, txt="Scheduled Tasks", ln=True, align='C')
-        pdf.ln(10)
+        with timed('pdf_render'):
+            pdf = FPDF()
+            pdf.add_page()
+            pdf.set_font("Arial", size=16, style='B')
+            pdf.cell(200, 10, txt="Scheduled Tasks", ln=True, align='C')
+            pdf.ln(10)
         
-        pdf.set_font("Arial", size=12)
+            pdf.set_font("Arial", size=12)
         
-        if not tasks:
-            pdf.cell(200, 10, txt="No tasks found", ln=True, align='C')
-        else:
-            for task in tasks:
-                title = task.get('title', 'Untitled Task')
-                date = task.get('date', 'No date')
-                start_time = task.get('startTime', 'No time')
-                end_time = task.get('endTime', '')
-                category = task.get('category', 'General')
-                completed = "✓" if task.get('completed', False) else "○"
+            if not tasks:
+                pdf.cell(200, 10, txt="No tasks found", ln=True, align='C')
+            else:
+                for task in tasks:
+                    title = task.get('title', 'Untitled Task')
+                    date = task.get('date', 'No date')
+                    start_time = task.get('startTime', 'No time')
+                    end_time = task.get('endTime', '')
+                    category = task.get('category', 'General')
+                    completed = "✓" if task.get('completed', False) else "○"
                 
-                # Task line
-                line = f"{completed} {title} | {date} {start_time}"
-                if end_time:
-                    line += f"-{end_time}"
-                line += f" | {category}"
+                    # Task line
+                    line = f"{completed} {title} | {date} {start_time}"
+                    if end_time:
+                        line += f"-{end_time}"
+                    line += f" | {category}"
                 
-                pdf.cell(200, 8, txt=line, ln=True)
-                pdf.ln(2)
+                    pdf.cell(200, 8, txt=line, ln=True)
+                    pdf.ln(2)
+            pdf_bytes = pdf.output(dest='S').encode('latin-1')
         
-        return pdf.output(dest='S').encode('latin-1'), 200, {
+        return pdf_bytes, 200, {
             'Content-Type': 'application/pdf',
             'Content-Disposition': 'attachment; filename=tasks.pdf'
         }
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @scheduler_bp.route('/api/tasks', methods=['POST'])
@@ -180,7 +197,10 @@ def add_task():
         else:
             return jsonify({'error': 'Failed to save task'}), 500
             
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @scheduler_bp.route('/api/tasks/<task_id>', methods=['PUT'])
@@ -211,7 +231,10 @@ def update_task(task_id):
         else:
             return jsonify({'error': 'Failed to save task'}), 500
             
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @scheduler_bp.route('/api/tasks/<task_id>', methods=['DELETE'])
@@ -230,10 +253,14 @@ def delete_task(task_id):
         else:
             return jsonify({'error': 'Failed to save tasks'}), 500
             
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
 
 @scheduler_bp.route('/api/ai/generate-tasks', methods=['POST'])
+@limit('generate_tasks')
 def generate_tasks():
     """Generate tasks from natural language prompt"""
     try:
@@ -433,5 +460,8 @@ def generate_tasks():
         
         return jsonify(generated_tasks), 200
         
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.exception('%s %s failed', request.method, request.path)
         return jsonify({'error': str(e)}), 500
@@ -11,17 +11,24 @@ import webbrowser
 import requests
 from urllib.parse import quote
 import re
+from instrumentation import timed
+from admission import limit
+
+MAX_AUDIO_BYTES = int(os.environ.get('MAX_AUDIO_BYTES', 10 * 1024 * 1024))
+MAX_AUDIO_SECONDS = float(os.environ.get('MAX_AUDIO_SECONDS', 60))
 
 @voice_bp.route('/api/voicechat', methods=['POST'])
+@limit('voicechat', max_body=MAX_AUDIO_BYTES)
 def voicechat():
 	# Accept audio file or text
 	if 'audio' in request.files:
 		recognizer = sr.Recognizer()
 		audio_file = request.files['audio']
-		with sr.AudioFile(audio_file) as source:
-			audio = recognizer.record(source)
+		with timed('audio_decode'), sr.AudioFile(audio_file) as source:
+			audio = recognizer.record(source, duration=MAX_AUDIO_SECONDS)
 		try:
-			user_text = recognizer.recognize_google(audio)
+			with timed('speech_recognition'):
+				user_text = recognizer.recognize_google(audio)
 		except Exception as e:
 			return jsonify({'response': f'Speech recognition error: {str(e)}'}), 400
 	else:
@@ -50,7 +57,8 @@ def voicechat():
 		elif text.startswith('search wikipedia for '):
 			query = text.replace('search wikipedia for ', '').strip()
 			try:
-				summary = wikipedia.summary(query, sentences=2)
+				with timed('wikipedia'):
+					summary = wikipedia.summary(query, sentences=2)
 				return f"Wikipedia summary for '{query}': {summary}"
 			except Exception as e:
 				return f"Wikipedia search error: {str(e)}"
@@ -58,7 +66,8 @@ def voicechat():
 			song_name = text.replace('open song ', '').strip()
 			search_url = f"https://www.youtube.com/results?search_query={quote(song_name)}"
 			try:
-				r = requests.get(search_url)
+				with timed('youtube_search'):
+					r = requests.get(search_url)
 				if r.status_code == 200 and 'watch?v=' in r.text:
 					match = re.search(r"watch\?v=([\w-]{11})", r.text)
 					if match: